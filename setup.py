@@ -29,7 +29,10 @@ setup(
         "alembic == 1.11.1",
     ],
     extras_require={
+        "orjson": ["orjson"],
         "ujson": ["ujson"],
+        "httpx": ["httpx"],
+        "zstandard": ["zstandard"],
     },
     include_package_data=True,
     zip_safe=False,
@@ -5,7 +5,9 @@ from collections.abc import Iterable
 import datetime
 import logging
 import sys
+import threading
 import traceback
+from typing import Union
 
 import alembic
 from sqlalchemy import (
@@ -19,13 +21,24 @@ from sqlalchemy import (
     String,
     Table,
     create_engine,
+    event,
 )
 from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
 from sqlalchemy.ext.automap import automap_base
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import text
 
 
+_COL_TYPES = {
+    datetime.date: Date,
+    str: String,
+    bool: Boolean,
+    int: Integer,
+    float: Float,
+}
+
+
 def create_logger(name: str, loglevel: str = "INFO") -> logging.Logger:
     """
     Initialises the default logger with given loglevel.
@@ -66,12 +79,17 @@ class SQLThemAll:
         simple (bool): Create a simplified database schema.
         autocommit (bool): Open the database in autocommit mode.
         echo (bool): Echo the executed SQL statements.
+        bulk_load (bool): Do not wait for commits to reach the disk.
+        stable_schema_after (int): Stop inferring the schema after this
+          many unchanged create_schema calls (0 never stops).
     """
 
     schema_changed: bool = False
     session = None
     loglevel: str = "INFO"
     progress: bool = True
+    progress_mask: int = 1023
+    schema_frozen: bool = False
 
     def __init__(
         self,
@@ -82,6 +100,8 @@ class SQLThemAll:
         autocommit: bool = False,
         root_table="main",
         echo: bool = False,
+        bulk_load: bool = False,
+        stable_schema_after: int = 0,
     ) -> None:
         """
         The contructor for SQLThemAll class.
@@ -95,6 +115,13 @@ class SQLThemAll:
             autocommit (bool): Open the database in autocommit mode.
             root_table (str): The name of the table to import the JSON root.
             echo (bool): Echo the executed SQL statements.
+            bulk_load (bool): Do not wait for commits to reach the disk.
+              Speeds up imports at the cost of durability (SQLite and
+              PostgreSQL only).
+            stable_schema_after (int): Stop inferring the schema after this
+              many consecutive calls of create_schema did not change it
+              (0 never stops). Keys the frozen schema has no column or
+              table for are then dropped with a warning.
         """
         self.dburl = dburl
         self.progress = progress
@@ -106,8 +133,15 @@ class SQLThemAll:
         self.simple = simple
         self.autocommit = autocommit
         self.root_table = str(root_table).lower()
+        self.bulk_load = bulk_load
+        self._schema_lock = threading.Lock()
+        self.stable_schema_after = stable_schema_after
+        self._stable_calls = 0
+        self._dropped_keys: set[tuple] = set()
 
         self.engine: Engine = create_engine(self.dburl, echo=self.echo)
+        if self.bulk_load:
+            event.listen(self.engine, "connect", self.disable_sync_commit)
         self.connection = self.engine.connect()
         self.metadata = MetaData()
         self.metadata.reflect(
@@ -117,6 +151,38 @@ class SQLThemAll:
         self.base.prepare(self.engine)
         self.classes = self.base.classes
 
+    def disable_sync_commit(self, dbapi_connection, _record) -> None:
+        """
+        Disables waiting for the disk on commit for a new connection.
+
+        Args:
+            dbapi_connection: DBAPI connection that has been opened.
+            _record: Connection pool record of the connection.
+        """
+        if self.engine.name == "sqlite":
+            statements = [
+                "PRAGMA synchronous = OFF",
+                "PRAGMA journal_mode = MEMORY",
+            ]
+        elif self.engine.name == "postgresql":
+            statements = ["SET SESSION synchronous_commit = OFF"]
+        else:
+            self._logger.warning(
+                f"Bulk load is not supported for {self.engine.name}"
+            )
+            return
+        # The settings must not be part of a transaction that is
+        # rolled back when the connection is returned to the pool.
+        autocommit = getattr(dbapi_connection, "autocommit", None)
+        if autocommit is False:
+            dbapi_connection.autocommit = True
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+        if autocommit is False:
+            dbapi_connection.autocommit = autocommit
+
     def create_many_to_one(self, name: str, current_table: Table) -> Table:
         """
         Adds a many to one relationship to the schema.
@@ -128,15 +194,13 @@ class SQLThemAll:
         Returns:
             Table: Newly created Table.
         """
+        ct_name = current_table.name
         self._logger.info(f"Creating table {name}")
         return Table(
             name,
             self.metadata,
             Column("_id", Integer, primary_key=True),
-            Column(
-                current_table.name + "_id",
-                ForeignKey(current_table.name + "._id"),
-            ),
+            Column(f"{ct_name}_id", ForeignKey(f"{ct_name}._id")),
             extend_existing=True,
         )
 
@@ -151,16 +215,14 @@ class SQLThemAll:
         Returns:
             Table: Newly created Table.
         """
+        ct_name = current_table.name
         self._logger.info(f"Creating table {name}")
-        self._logger.info(f"Creating bridge {current_table.name} - {name}")
+        self._logger.info(f"Creating bridge {ct_name} - {name}")
         Table(
-            "bridge_" + current_table.name + "_" + name,
+            f"bridge_{ct_name}_{name}",
             self.metadata,
-            Column(
-                current_table.name + "_id",
-                ForeignKey(current_table.name + "._id"),
-            ),
-            Column(name + "_id", ForeignKey(name + "._id")),
+            Column(f"{ct_name}_id", ForeignKey(f"{ct_name}._id")),
+            Column(f"{name}_id", ForeignKey(f"{name}._id")),
             extend_existing=True,
         )
         return Table(
@@ -178,15 +240,13 @@ class SQLThemAll:
         Returns:
             Table: Newly created Table.
         """
+        ct_name = current_table.name
         self._logger.info(f"Creating table {name}")
         return Table(
             name,
             self.metadata,
             Column("_id", Integer, primary_key=True),
-            Column(
-                current_table.name + "_id",
-                ForeignKey(current_table.name + "._id"),
-            ),
+            Column(f"{ct_name}_id", ForeignKey(f"{ct_name}._id")),
             extend_existing=True,
         )
 
@@ -201,26 +261,28 @@ class SQLThemAll:
         Returns:
             Table: Newly created Table.
         """
+        ct_name = current_table.name
         self._logger.info(f"Creating table {name}")
         return Table(
             name,
             self.metadata,
             Column("_id", Integer, primary_key=True),
-            Column(
-                current_table.name + "_id",
-                ForeignKey(current_table.name + "._id"),
-            ),
+            Column(f"{ct_name}_id", ForeignKey(f"{ct_name}._id")),
             extend_existing=True,
         )
 
     def create_schema(
-        self, jsonobj: dict, root_table: str = "", simple: bool = False
+        self,
+        jsonobj: Union[dict, list],
+        root_table: str = "",
+        simple: bool = False,
     ) -> None:
         """
         Creates table_schema from the structure of a given JSON object.
 
         Args:
-            jsonobj (dict): jsonobj.
+            jsonobj (dict|list): JSON object or list of rows of the root
+              table.
             root_table (str): Table name of the JSON object root.
             simple (bool): Create a simple database schema.
         """
@@ -238,7 +300,11 @@ class SQLThemAll:
         if not simple:
             simple = self.simple
 
+        if self.schema_frozen:
+            return
+
         self.schema_changed = False
+        debug = self._logger.isEnabledFor(logging.DEBUG)
 
         if root_table not in self.metadata.tables:
             self.schema_changed = True
@@ -270,7 +336,9 @@ class SQLThemAll:
                 props = set(cls.__dict__.keys())
             else:
                 props = set()
-            self._logger.debug(f"Forbinden col names: {props}")
+            if debug:
+                self._logger.debug(f"Forbinden col names: {props}")
+            get_col_type = _COL_TYPES.get
 
             if isinstance(obj, dict):
                 if "_id" in obj:
@@ -280,11 +348,7 @@ class SQLThemAll:
                     if k == "":
                         continue
                     if k in (c.name for c in current_table.columns):
-
-                        def has_vals(v):
-                            return isinstance(v, (dict, list)) and any(v)
-
-                        if has_vals(val):
+                        if isinstance(val, (dict, list)) and any(val):
                             if k not in self.metadata.tables:
                                 self.schema_changed = True
                                 if not simple:
@@ -299,40 +363,33 @@ class SQLThemAll:
                                     tbl.create(self.engine)
                             else:
                                 tbl = self.metadata.tables[k]
-                            if val.__class__ == dict:
+                            if isinstance(val, dict):
                                 parse_dict(obj=val, current_table=tbl)
                             else:
                                 for i in val:
-                                    if i.__class__ == dict and i:
+                                    if isinstance(i, dict) and i:
                                         parse_dict(obj=i, current_table=tbl)
                                     else:
                                         parse_dict(
                                             obj={"value": i}, current_table=tbl
                                         )
                         else:
-                            self._logger.debug(
-                                f"{k} exists in table {current_table.name}"
-                            )
+                            if debug:
+                                self._logger.debug(
+                                    f"{k} exists in table {current_table.name}"
+                                )
                             continue
                     else:
                         if k in props:
                             self._logger.info(f"Excluded Prop: {k}")
                             continue
-                        self.schema_changed = True
-                        col_types = {
-                            datetime.date: Date,
-                            str: String,
-                            bool: Boolean,
-                            int: Integer,
-                            float: Float,
-                        }
-                        if val.__class__ in col_types:
-                            current_table.append_column(
-                                Column(k, col_types[val.__class__]())
-                            )
+                        col_type = get_col_type(val.__class__)
+                        if col_type is not None:
+                            self.schema_changed = True
+                            current_table.append_column(Column(k, col_type()))
                             statement = alembic.ddl.base.AddColumn(
                                 current_table.name,
-                                Column(k, col_types[val.__class__]()),
+                                Column(k, col_type()),
                             ).compile()
                             self.connection.execute(text(str(statement)))
                             self._logger.info(
@@ -340,6 +397,7 @@ class SQLThemAll:
                             )
                         elif isinstance(val, dict):
                             if k not in self.metadata.tables:
+                                self.schema_changed = True
                                 if not simple:
                                     tbl = self.create_many_to_one(
                                         name=k, current_table=current_table
@@ -354,12 +412,12 @@ class SQLThemAll:
                                 tbl = self.metadata.tables[k]
                             parse_dict(obj=val, current_table=tbl)
 
-                        elif val.__class__ == list:
+                        elif isinstance(val, list):
                             if val:
                                 if not [i for i in val if i]:
                                     continue
                                 val = [
-                                    item.__class__ == dict
+                                    isinstance(item, dict)
                                     and item
                                     or {"value": item}
                                     for item in val
@@ -384,32 +442,159 @@ class SQLThemAll:
                                         tbl = self.metadata.tables[k]
                                     parse_dict(obj=item, current_table=tbl)
 
-        if jsonobj.__class__ == list:
-            jsonobj = {self.root_table: jsonobj}
-        parse_dict(obj=jsonobj)
+        if isinstance(jsonobj, list):
+            # Rows of the root table, parsed without a wrapping object
+            if any(jsonobj):
+                for item in jsonobj:
+                    parse_dict(
+                        obj=isinstance(item, dict) and item or {"value": item}
+                    )
+        else:
+            parse_dict(obj=jsonobj)
 
         if self.schema_changed:
             self.metadata.create_all(self.engine)
             self.metadata.reflect(
                 self.engine, extend_existing=True, autoload_replace=True
             )
-            self.base = automap_base(metadata=self.metadata)
-            self.base.prepare(self.engine)
+            # Prepare the new base before publishing it, concurrent
+            # importers must never see an unprepared automap base.
+            base = automap_base(metadata=self.metadata)
+            base.prepare(self.engine)
+            self.base = base
             self.classes = self.base.classes
+        self.count_stable_schema(changed=self.schema_changed)
         self.schema_changed = False
 
-    def insert_data_to_schema(self, jsonobj: dict) -> None:
+    def count_stable_schema(self, changed: bool) -> None:
+        """
+        Counts consecutive calls of create_schema which did not change the
+        schema and freezes the schema once stable_schema_after is reached.
+
+        Args:
+            changed (bool): Whether the last call changed the schema.
+        """
+        if changed:
+            self._stable_calls = 0
+            return
+        self._stable_calls += 1
+        if 0 < self.stable_schema_after <= self._stable_calls:
+            self.schema_frozen = True
+            self._logger.info(
+                f"Schema stable for {self._stable_calls} calls, freezing it"
+            )
+
+    def insert_data_to_schema(
+        self, jsonobj: Union[dict, list], raise_errors: bool = False
+    ) -> bool:
         """
         Inserts the given JSON object into the database creating.
 
         the schema if not availible.
 
         Args:
-            jsonobj (dict): Object to parse.
+            jsonobj (dict|list): Object to parse or list of rows of the
+              root table.
+            raise_errors (bool): Reraise errors after the rollback instead
+              of printing them.
+
+        Returns:
+            bool: True if the data has been committed, False if the
+            transaction has been rolled back.
         """
 
+        leaf_rows: list = []
+        # Formatting the debug messages of every object is expensive
+        debug = self._logger.isEnabledFor(logging.DEBUG)
+        # One snapshot of the classes per insert, concurrent imports may
+        # publish a new automap base while this one is running
+        classes = self.base.classes
+        progress_counter = 0
+        frozen = self.schema_frozen
+
+        def new_obj(name: str, pre_ormobjc: dict, session: Session):
+            """
+            Creates a new ORM object and adds it to the session.
+
+            Args:
+                name (str): Name of the table that will represent the object.
+                pre_ormobjc (dict): Column values of the object.
+                session (Session): Session to use.
+
+            Returns:
+                ormobject: Object defined by the object relational model.
+            """
+            ormobjc = classes[name](**pre_ormobjc)
+            session.add(ormobjc)
+            if debug:
+                self._logger.debug(f"Adding {name} to session")
+            return ormobjc
+
+        def drop_key(name: str, key: str = "") -> None:
+            """
+            Warns once about a key the frozen schema can not store.
+
+            Args:
+                name (str): Name of the table of the object.
+                key (str): Dropped column, empty if the whole table is
+                  missing.
+            """
+            if (name, key) in self._dropped_keys:
+                return
+            self._dropped_keys.add((name, key))
+            if key:
+                self._logger.warning(
+                    f"Dropping key {key} of {name}, the frozen schema has "
+                    "no such column"
+                )
+            else:
+                self._logger.warning(
+                    f"Dropping objects of {name}, the frozen schema has no "
+                    "such table"
+                )
+
+        def get_or_new_obj(name: str, pre_ormobjc: dict, session: Session):
+            """
+            Returns an equal object of the database or creates a new one.
+
+            Args:
+                name (str): Name of the table that will represent the object.
+                pre_ormobjc (dict): Column values of the object.
+                session (Session): Session to use.
+
+            Returns:
+                ormobject: Object defined by the object relational model.
+            """
+            query = session.query(classes[name])
+            in_session = query.filter_by(**pre_ormobjc).first()
+            if in_session:
+                return in_session
+            return new_obj(name, pre_ormobjc, session)
+
+        # The simple schema has no many to many relations, objects are
+        # never shared and do not need to be looked up.
+        get_obj = new_obj if self.simple else get_or_new_obj
+
+        def is_leaf(objc) -> bool:
+            """
+            Checks if the given object has no nested objects or arrays.
+
+            Args:
+                objc (dict): Object to check.
+
+            Returns:
+                bool: True if no child objects will be created from objc.
+            """
+            return not any(
+                isinstance(v, (dict, list)) and v for v in objc.values()
+            )
+
         def make_relational_obj(
-            name, objc, session: Session, skip_empty: bool = True
+            name,
+            objc,
+            session: Session,
+            skip_empty: bool = True,
+            as_row: bool = False,
         ):
             """
             Generates a relational object which is insertable from.
@@ -421,15 +606,26 @@ class SQLThemAll:
                 objc (dict): Object to parse.
                 session (Session): Session to use.
                 skip_empty (bool): Skipts objects without any information.
+                as_row (bool): Return the column values of a leaf object
+                  instead of an ORM object (bulk inserted afterwards).
 
             Returns:
                 ormobject: Object defined by the object relational model.
             """
-            self._logger.debug(f"Make relational object ({name}) from: {objc}")
+            nonlocal progress_counter
+            if debug:
+                self._logger.debug(
+                    f"Make relational object ({name}) from: {objc}"
+                )
             name = name.lower()
-            pre_ormobjc, collectiondict = {}, {}
-            if objc.__class__ != dict:
+            pre_ormobjc, collectiondict, leafdict = {}, {}, {}
+            if not isinstance(objc, dict):
                 return None
+            if frozen:
+                if name not in classes:
+                    drop_key(name)
+                    return None
+                columns = classes[name].__table__.columns
             if "_id" in objc:
                 objc["id"] = objc.pop("_id")
             for k, val in objc.items():
@@ -439,92 +635,172 @@ class SQLThemAll:
                 k = k.lower()
                 if isinstance(val, (dict, list)):
                     if isinstance(val, dict):
+                        rows = self.simple and is_leaf(val)
                         _collection = [
                             i
                             for i in [
-                                make_relational_obj(k, val, session=session)
+                                make_relational_obj(
+                                    k, val, session=session, as_row=rows
+                                )
                             ]
                             if i
                         ]
                         if _collection:
-                            collectiondict[k] = _collection
+                            if rows:
+                                leafdict[k] = _collection
+                            else:
+                                collectiondict[k] = _collection
                     elif isinstance(val, list):
                         if val:
                             # if True:
                             val = [
-                                i.__class__ == dict and i or {"value": i}
+                                isinstance(i, dict) and i or {"value": i}
                                 for i in val
                             ]
+                            rows = self.simple and all(map(is_leaf, val))
                             _collection = [
                                 j
                                 for j in [
-                                    make_relational_obj(k, i, session=session)
+                                    make_relational_obj(
+                                        k, i, session=session, as_row=rows
+                                    )
                                     for i in val
                                 ]
                                 if j and j != {"value": None}
                             ]
                             if not _collection:
                                 continue
-                            collectiondict[k] = _collection
+                            if rows:
+                                leafdict[k] = _collection
+                            else:
+                                collectiondict[k] = _collection
+                elif frozen and k not in columns:
+                    drop_key(name, k)
                 else:
                     pre_ormobjc[k] = val
             if not pre_ormobjc:
+                for k, val in leafdict.items():
+                    leaf_rows.append((k, None, val))
                 return None
             if self.progress:
-                sys.stdout.write(".")
-                sys.stdout.flush()
-            self._logger.debug(f"{pre_ormobjc}")
-            if not self.simple:
-                query = session.query(self.base.classes[name])
-                in_session = query.filter_by(**pre_ormobjc).first()
-            else:
-                in_session = False
-
-            if in_session:
-                ormobjc = in_session
-                if collectiondict:
-                    for k, val in collectiondict.items():
-                        if val:
-                            setattr(
-                                ormobjc,
-                                k.lower() + "_collection",
-                                val,
-                            )
-            else:
-                self._logger.debug(f"pre_ormobjc: {pre_ormobjc}")
-                ormobjc = self.base.classes[name](**pre_ormobjc)
-                self._logger.debug(f"ormobjc: {ormobjc}")
-
-                if collectiondict:
-                    for k, val in collectiondict.items():
-                        setattr(
-                            ormobjc,
-                            k.lower() + "_collection",
-                            val,
-                        )
-
-                if ormobjc:
-                    session.add(ormobjc)
-                    self._logger.debug(f"Adding {name} to session")
-                else:
-                    return None
+                progress_counter += 1
+                if not progress_counter & self.progress_mask:
+                    sys.stdout.write(".")
+                    sys.stdout.flush()
+            if debug:
+                self._logger.debug(f"{pre_ormobjc}")
+            if as_row:
+                return pre_ormobjc
+
+            ormobjc = get_obj(name, pre_ormobjc, session)
+            for k, val in collectiondict.items():
+                setattr(ormobjc, k.lower() + "_collection", val)
+            for k, val in leafdict.items():
+                leaf_rows.append((k, ormobjc, val))
 
             return ormobjc
 
-        if jsonobj.__class__ == list:
-            jsonobj = {self.root_table: jsonobj}
+        def insert_leaf_rows(session: Session) -> None:
+            """
+            Bulk inserts the collected leaf rows, linked to their parents.
+
+            Args:
+                session (Session): Session to use.
+            """
+            session.flush()
+            mappings: dict = {}
+            for name, parent, rows in leaf_rows:
+                if parent is not None:
+                    fkey = f"{parent.__table__.name}_id"
+                    if fkey in classes[name].__table__.columns:
+                        for row in rows:
+                            row[fkey] = parent._id
+                mappings.setdefault(name, []).extend(rows)
+            for name, rows in mappings.items():
+                self._logger.debug(f"Bulk inserting {len(rows)} rows: {name}")
+                session.bulk_insert_mappings(classes[name], rows)
+
+        def insert_rows(rows: list, session: Session) -> None:
+            """
+            Generates the relational objects of rows of the root table
+            without wrapping them into a parent object first.
+
+            Args:
+                rows (list): Rows of the root table.
+                session (Session): Session to use.
+            """
+            rows = [isinstance(i, dict) and i or {"value": i} for i in rows]
+            as_row = self.simple and all(map(is_leaf, rows))
+            _collection = [
+                j
+                for j in [
+                    make_relational_obj(
+                        self.root_table, i, session=session, as_row=as_row
+                    )
+                    for i in rows
+                ]
+                if j and j != {"value": None}
+            ]
+            if as_row and _collection:
+                leaf_rows.append((self.root_table, None, _collection))
 
         with Session(self.engine) as session:
-            make_relational_obj(
-                name=self.root_table, objc=jsonobj, session=session
-            )
-            if self.progress:
-                sys.stdout.write("\n")
             try:
+                if isinstance(jsonobj, list):
+                    insert_rows(jsonobj, session)
+                else:
+                    make_relational_obj(
+                        name=self.root_table, objc=jsonobj, session=session
+                    )
+                if leaf_rows:
+                    insert_leaf_rows(session)
                 session.commit()
             except Exception:
-                traceback.print_exc()
                 session.rollback()
+                if raise_errors:
+                    raise
+                traceback.print_exc()
+                return False
+            finally:
+                if self.progress and progress_counter > self.progress_mask:
+                    sys.stdout.write("\n")
+        return True
+
+    def insert_batch(self, jsonobjs: list) -> None:
+        """
+        Inserts a list of JSON objects isolating the ones that fail.
+
+        If the batch can not be committed it is split in halves which are
+        retried, so a single bad object only drops itself and the valid
+        objects are still inserted with a few commits. Connection level
+        errors fail every half alike and are raised right away.
+
+        Args:
+            jsonobjs (list): Objects to insert into the root table.
+        """
+        try:
+            self.insert_data_to_schema(jsonobjs, raise_errors=True)
+            return
+        except (OperationalError, InterfaceError):
+            raise
+        except DBAPIError as e:
+            if e.connection_invalidated:
+                raise
+            error: Exception = e
+        except Exception as e:  # pylint: disable=broad-except
+            error = e
+        if len(jsonobjs) == 1:
+            self._logger.error(
+                "Skipped an object that could not be inserted",
+                exc_info=error,
+            )
+            return
+        self._logger.debug(
+            f"Batch of {len(jsonobjs)} objects failed, splitting it: {error}"
+        )
+        mid = len(jsonobjs) // 2
+        self.insert_batch(jsonobjs[:mid])
+        self.insert_batch(jsonobjs[mid:])
 
     def import_json(self, jsonobj: dict) -> None:
         """
@@ -545,7 +821,8 @@ class SQLThemAll:
             self.base.prepare(self.engine)
             self.classes = self.base.classes
 
-        self.create_schema(jsonobj)
+        with self._schema_lock:
+            self.create_schema(jsonobj)
         self.insert_data_to_schema(jsonobj)
 
     def import_multi_json(self, jsonobjs: Iterable) -> None:
@@ -557,9 +834,14 @@ class SQLThemAll:
         Args:
             jsonobjs (Iterable): Object to parse.
         """
+        if isinstance(jsonobjs, dict):
+            # A single JSON object, list() would only keep its keys
+            self.import_json(jsonobjs)
+            return
         if not self.connection or self.connection.closed:
             self.connection = self.engine.connect()
 
-        jsonobj = {self.root_table: jsonobjs}
-        self.create_schema(jsonobj)
-        self.insert_data_to_schema(jsonobj)
+        jsonobjs = list(jsonobjs)
+        with self._schema_lock:
+            self.create_schema(jsonobjs)
+        self.insert_batch(jsonobjs)
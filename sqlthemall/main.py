@@ -3,9 +3,21 @@
 """This is the entry point for the command line script `sqlthemall`."""
 
 import argparse
+import bz2
+import contextlib
+import functools
+import gzip
+import io
+import logging
+import lzma
+import mmap
+import os
+import queue
+import stat
 import sys
+import threading
 import traceback
-import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from http.client import HTTPResponse
 from io import TextIOWrapper
 from urllib.error import URLError
@@ -13,14 +25,45 @@ from urllib.error import URLError
 from _io import TextIOWrapper as TextIO
 
 try:
-    import ujson as json
+    import orjson as json
 except ImportError:
-    import json  # type: ignore
+    try:
+        import ujson as json  # type: ignore
+    except ImportError:
+        import json  # type: ignore
+
+try:
+    import httpx
+
+    URL_ERRORS: tuple = (URLError, httpx.HTTPError)
+except ImportError:
+    httpx = None  # type: ignore
+    URL_ERRORS = (URLError,)
 
-from typing import Iterator, Optional, Union
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore
+
+from typing import (
+    BinaryIO,
+    Callable,
+    Generator,
+    Iterable,
+    Iterator,
+    Optional,
+    Union,
+)
 
 from sqlthemall.json_importer import SQLThemAll
 
+logger = logging.getLogger("sqlthemall")
+
+BUFFER_SIZE = 1 << 20
+COMPRESSED_SUFFIXES = (".gz", ".bz2", ".xz", ".zst")
+# Only orjson parses memoryviews, the other backends need a bytes copy
+MMAP_JSON = json.__name__ == "orjson"
+
 
 def parse_json(jsonstr: Union[str, bytes]) -> Optional[Union[dict, list]]:
     """
@@ -32,17 +75,17 @@ def parse_json(jsonstr: Union[str, bytes]) -> Optional[Union[dict, list]]:
     Returns:
         dict or list: Parsed JSON input.
     """
-    if not jsonstr:
+    if not jsonstr or jsonstr.isspace():
         return None
     try:
         return json.loads(jsonstr)
-    except json.JSONDecodeError:
-        traceback.print_exc()
+    except json.JSONDecodeError as e:
+        logger.error(f"Could not parse JSON: {e}")
         return None
 
 
 def read_json(
-    source_descriptor: Union[TextIOWrapper, TextIO, HTTPResponse],
+    source_descriptor: Union[TextIOWrapper, TextIO, HTTPResponse, Iterator],
     lines: bool = False,
     batch_size: int = 100,
 ) -> Iterator[Optional[Union[dict,list]]]:
@@ -50,28 +93,67 @@ def read_json(
     Unifies reading JSON from different sources (url, file, stdin).
 
     Parameters:
-        source_descriptor: Filedescriptor, Responsedescriptor or sys.stdin.
+        source_descriptor: Filedescriptor, Responsedescriptor or sys.stdin
+          (or any iterator over lines if lines is True).
         lines (bool): Parse lines instead of complete source.
-        batch_size (int): How many lines should be returned per yield.
+        batch_size (int): How many objects should be returned per yield.
 
     Returns:
         Iterator[Optional[dict|list]]: Parsed JSON input.
     """
     if lines is False:
-        yield parse_json(source_descriptor.read())
-    else:
-        while True:
-            _lines: list = []
-            for _n in range(batch_size):
-                line = source_descriptor.readline()
-                if not line:
-                    break
-                obj = parse_json(line.strip())
-                if obj:
-                    _lines.append(obj)
-            if not _lines:
-                break
-            yield _lines
+        return read_whole_json(source_descriptor)
+    return read_json_lines(source_descriptor, batch_size=batch_size)
+
+
+def read_whole_json(
+    source_descriptor: Union[TextIOWrapper, TextIO, HTTPResponse],
+) -> Iterator[Optional[Union[dict, list]]]:
+    """
+    Reads a single JSON document from the source.
+
+    Parameters:
+        source_descriptor: Filedescriptor, Responsedescriptor or sys.stdin.
+
+    Returns:
+        Iterator[Optional[dict|list]]: The parsed JSON document.
+    """
+    yield parse_json(source_descriptor.read())
+
+
+def read_json_lines(
+    source_descriptor: Union[TextIOWrapper, TextIO, HTTPResponse, Iterator],
+    batch_size: int = 100,
+) -> Iterator[list]:
+    """
+    Reads JSON lines from the source in batches.
+
+    Blank and invalid lines are skipped.
+
+    Parameters:
+        source_descriptor: Filedescriptor, Responsedescriptor, sys.stdin
+          or any iterator over lines.
+        batch_size (int): How many objects should be returned per yield.
+
+    Returns:
+        Iterator[list]: Batches of parsed JSON objects.
+    """
+    loads = json.loads
+    _lines: list = []
+    for line in source_descriptor:
+        try:
+            obj = loads(line)
+        except ValueError as e:
+            if line.strip():
+                logger.warning(f"Skipped invalid JSON line: {e}")
+            continue
+        if obj:
+            _lines.append(obj)
+            if len(_lines) == batch_size:
+                yield _lines
+                _lines = []
+    if _lines:
+        yield _lines
 
 
 def gen_importer(args: argparse.Namespace) -> SQLThemAll:
@@ -85,16 +167,160 @@ def gen_importer(args: argparse.Namespace) -> SQLThemAll:
         SQLThemAll: Importer.
     """
     return SQLThemAll(
-        dburl=args.dburl[0],
-        loglevel=args.loglevel[0],
+        dburl=args.dburl,
+        loglevel=args.loglevel,
         progress=not args.no_progress,
         autocommit=args.autocommit,
         simple=args.simple,
-        root_table=args.root_table[0],
+        root_table=args.root_table,
         echo=args.echo,
+        bulk_load=args.bulk_load,
+        stable_schema_after=args.stable_schema_after,
     )
 
 
+def iter_byte_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Splits a stream of byte chunks into lines without decoding them.
+
+    Args:
+        chunks (Iterable[bytes]): Chunks of the byte stream.
+
+    Returns:
+        Iterator[bytes]: Lines of the byte stream.
+    """
+    pending: list = []
+    for chunk in chunks:
+        pending.append(chunk)
+        if b"\n" in chunk:
+            lines = b"".join(pending).split(b"\n")
+            pending = [lines.pop()]
+            yield from lines
+    tail = b"".join(pending)
+    if tail:
+        yield tail
+
+
+def new_http_client():
+    """
+    Creates a httpx client which keeps connections alive between requests.
+
+    Returns:
+        httpx.Client: The client (a context yielding None if httpx is not
+          installed).
+    """
+    if httpx is None:
+        return contextlib.nullcontext()
+    return httpx.Client(timeout=300, follow_redirects=True)
+
+
+def read_url(
+    url: str, lines: bool = False, batch_size: int = 100, client=None
+) -> Iterator[Optional[Union[dict, list]]]:
+    """
+    Streams JSON from an URL using httpx if available (urllib otherwise).
+
+    Args:
+        url (str): URL to read JSON from.
+        lines (bool): Parse lines instead of complete source.
+        batch_size (int): How many objects should be returned per yield.
+        client (httpx.Client): Client to reuse connections from
+          (default: a new client per URL).
+
+    Returns:
+        Iterator[Optional[dict|list]]: Parsed JSON input.
+    """
+    if httpx is not None:
+        if client is None:
+            with new_http_client() as client:
+                yield from read_url(url, lines, batch_size, client)
+            return
+        with client.stream("GET", url) as res:
+            res.raise_for_status()
+            yield from read_json(
+                iter_byte_lines(res.iter_bytes()) if lines else res,
+                lines=lines,
+                batch_size=batch_size,
+            )
+    else:
+        import urllib.request  # pylint: disable=import-outside-toplevel
+
+        req = urllib.request.Request(url, headers={"Accept-Encoding": "gzip"})
+        with urllib.request.urlopen(req, timeout=300) as res:
+            if res.headers.get("Content-Encoding") == "gzip":
+                res = gzip.GzipFile(fileobj=res)
+            res = io.BufferedReader(res, buffer_size=BUFFER_SIZE)
+            yield from read_json(res, lines=lines, batch_size=batch_size)
+
+
+def open_file(path: str) -> Union[io.BufferedIOBase, BinaryIO]:
+    """
+    Opens a file for binary reading, decompressing it transparently if
+    its suffix is .gz, .bz2, .xz or .zst.
+
+    Args:
+        path (str): Path of the file to open.
+
+    Returns:
+        Union[io.BufferedIOBase, BinaryIO]: Binary file object.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".xz"):
+        return lzma.open(path, "rb")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ValueError("Reading .zst files requires zstandard")
+        return io.BufferedReader(
+            zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+        )
+    return open(path, "rb", buffering=BUFFER_SIZE)
+
+
+def is_mappable(path: str) -> bool:
+    """
+    Checks whether a file can be parsed through a memory map.
+
+    Args:
+        path (str): Path of the file to check.
+
+    Returns:
+        bool: True for non-empty, uncompressed regular files.
+    """
+    if not MMAP_JSON or path.endswith(COMPRESSED_SUFFIXES):
+        return False
+    st = os.stat(path)
+    return stat.S_ISREG(st.st_mode) and st.st_size > 0
+
+
+def read_mapped(path: str) -> Optional[Union[dict, list]]:
+    """
+    Parses a whole JSON file through a read-only memory map.
+
+    orjson parses the mapped pages directly, without copying the file into
+    a bytes object first.
+
+    Args:
+        path (str): Path of the file to parse.
+
+    Returns:
+        dict or list: Parsed JSON input.
+    """
+    with open(path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(mm) as view:
+            try:
+                return json.loads(view)
+            except json.JSONDecodeError as e:
+                logger.error(f"Could not parse JSON: {e}")
+                return None
+
+
 def read_from_source(
     args: argparse.Namespace,
 ) -> Iterator[Optional[Union[dict,list]]]:
@@ -112,20 +338,32 @@ def read_from_source(
     """
     try:
         if args.url:
-            with urllib.request.urlopen(args.url[0], timeout=300) as res:
-                yield from read_json(
-                    res, lines=args.line, batch_size=args.batch_size[0]
-                )
-        elif args.file:
-            with open(args.file[0]) as f:
-                yield from read_json(
-                    f, lines=args.line, batch_size=args.batch_size[0]
-                )
-        else:
-            yield from read_json(
-                sys.stdin, lines=args.line, batch_size=args.batch_size[0]
+            with new_http_client() as client:
+                for url in args.url:
+                    yield from read_url(
+                        url,
+                        lines=args.line,
+                        batch_size=args.batch_size,
+                        client=client,
+                    )
+            return
+        reader: Callable[..., Iterator[Optional[Union[dict, list]]]]
+        if args.line:
+            reader = functools.partial(
+                read_json_lines, batch_size=args.batch_size
             )
-    except URLError:
+        else:
+            reader = read_whole_json
+        if args.file:
+            for path in args.file:
+                if not args.line and is_mappable(path):
+                    yield read_mapped(path)
+                    continue
+                with open_file(path) as f:
+                    yield from reader(f)
+        else:
+            yield from reader(sys.stdin.buffer)
+    except URL_ERRORS:
         traceback.print_exc()
         sys.exit(3)
     except BaseException as e:
@@ -133,34 +371,180 @@ def read_from_source(
         raise e
 
 
-def parse_args(args: list[str]) -> argparse.Namespace:
+def coalesce(
+    batches: Iterable[Optional[Union[dict, list]]], n: int
+) -> Iterator[list]:
     """
-    Parses the provided list of args.
+    Joins every n consecutive batches into one larger batch.
 
     Args:
-        args (list[str]): List of arguments to parse.
+        batches (Iterable[Optional[Union[dict, list]]]): Batches of JSON
+          objects, a single object counts as a batch of its own.
+        n (int): Number of batches to join.
 
     Returns:
-        argparse.Namespace: Namespace the arguments have been read in.
+        Iterator[list]: The joined batches.
+    """
+    joined: list = []
+    count = 0
+    for batch in batches:
+        if not batch:
+            continue
+        if isinstance(batch, dict):
+            joined.append(batch)
+        else:
+            joined.extend(batch)
+        count += 1
+        if count == n:
+            yield joined
+            joined = []
+            count = 0
+    if joined:
+        yield joined
+
+
+def prefetch(items: Iterable, depth: int = 2) -> Generator:
+    """
+    Reads items ahead in a background thread.
+
+    Reading and parsing the next batches overlaps with the import of the
+    current one. Exceptions of the reader are raised in the consumer.
+    Once the consumer stops, the reader thread stops as well and closes
+    the source iterator.
+
+    Args:
+        items (Iterable): Items to read ahead.
+        depth (int): Maximum number of items read ahead.
+
+    Returns:
+        Generator: The items in their original order, closing it stops
+        the reader thread.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(entry: tuple) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        source = iter(items)
+        try:
+            for item in source:
+                if not put((item, None)):
+                    return
+        except BaseException as e:  # pylint: disable=broad-except
+            put((done, e))
+        else:
+            put((done, None))
+        finally:
+            # Generators must be closed by the thread running them
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def import_concurrently(
+    importer: SQLThemAll,
+    batches: Iterable[Optional[Union[dict, list]]],
+    workers: int,
+) -> None:
+    """
+    Imports batches of JSON objects using a pool of worker threads.
+
+    The schema creation is serialized by the importer, the inserts of the
+    different batches run concurrently on separate connections.
+
+    Args:
+        importer (SQLThemAll): Importer to use.
+        batches (Iterable): Batches of JSON objects to import.
+        workers (int): Number of worker threads.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: set = set()
+        for batch in batches:
+            if batch is None:
+                continue
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(executor.submit(importer.import_multi_json, batch))
+        for future in wait(pending).done:
+            future.result()
+
+
+def int_at_least(minimum: int) -> Callable[[str], int]:
+    """
+    Creates an argparse type for integers of at least the given value.
+
+    Args:
+        minimum (int): Smallest accepted value.
+
+    Returns:
+        Callable[[str], int]: Converts an argument to int or raises an
+        argparse.ArgumentTypeError.
+    """
+
+    def convert(value: str) -> int:
+        try:
+            number = int(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                f"invalid int value: {value!r}"
+            ) from None
+        if number < minimum:
+            raise argparse.ArgumentTypeError(
+                f"must be at least {minimum}, got {number}"
+            )
+        return number
+
+    return convert
+
+
+@functools.cache
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the argument parser of the command line script (only once).
+
+    Returns:
+        argparse.ArgumentParser: The argument parser.
     """
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "-d",
         "--databaseurl",
-        nargs=1,
         dest="dburl",
         required=True,
         help="Database url to use",
     )
     parser.add_argument(
-        "-u", "--url", nargs=1, dest="url", help="URL to read JSON from"
+        "-u", "--url", nargs="+", dest="url", help="URLs to read JSON from"
     )
     parser.add_argument(
         "-f",
         "--file",
-        nargs=1,
+        nargs="+",
         dest="file",
-        help="File to read JSON from (default: stdin)",
+        help="Files to read JSON from (default: stdin)",
     )
     parser.add_argument(
         "-s",
@@ -184,9 +568,8 @@ def parse_args(args: list[str]) -> argparse.Namespace:
         "-L",
         "--loglevel",
         choices=("ERROR", "WARNING", "INFO", "DEBUG"),
-        default=["INFO"],
+        default="INFO",
         help="Set the log level",
-        nargs=1,
         dest="loglevel",
     )
     parser.add_argument(
@@ -205,9 +588,8 @@ def parse_args(args: list[str]) -> argparse.Namespace:
     parser.add_argument(
         "-t",
         "--root-table",
-        nargs=1,
         dest="root_table",
-        default=["main"],
+        default="main",
         help="Name of the root table to import tthe JSON object into",
     )
     parser.add_argument(
@@ -225,14 +607,91 @@ def parse_args(args: list[str]) -> argparse.Namespace:
     parser.add_argument(
         "-N",
         "--batch_size",
-        nargs=1,
-        type=int,
+        type=int_at_least(1),
         dest="batch_size",
-        default=[100],
-        help="Number of objects processed per commit in JSONline mode",
+        default=100,
+        help="Number of objects read per batch in JSONline mode (see -C "
+        "for the number of batches per commit)",
+    )
+    parser.add_argument(
+        "-B",
+        "--bulk-load",
+        action="store_true",
+        dest="bulk_load",
+        help="Do not wait for commits to reach the disk (faster, but not "
+        "crash safe; SQLite and PostgreSQL only)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int_at_least(1),
+        dest="workers",
+        default=None,
+        help="Import batches concurrently with this many threads in "
+        "JSONline mode (simple schema only, not used with SQLite)",
+    )
+    parser.add_argument(
+        "-F",
+        "--stable-schema-after",
+        type=int_at_least(0),
+        dest="stable_schema_after",
+        default=0,
+        help="Stop inferring the schema after it did not change for this "
+        "many batches (default: 0, never stop). Keys without a column or "
+        "table are then dropped with a warning",
+    )
+    parser.add_argument(
+        "-C",
+        "--commit-batch",
+        type=int_at_least(1),
+        dest="commit_batch",
+        default=1,
+        help="Number of batches imported per commit in JSONline mode",
     )
 
-    return parser.parse_args(args)
+    return parser
+
+
+def parse_args(args: list[str]) -> argparse.Namespace:
+    """
+    Parses the provided list of args.
+
+    Args:
+        args (list[str]): List of arguments to parse.
+
+    Returns:
+        argparse.Namespace: Namespace the arguments have been read in.
+    """
+    return build_parser().parse_args(args)
+
+
+def use_concurrent_import(
+    args: argparse.Namespace, importer: SQLThemAll
+) -> bool:
+    """
+    Decides whether batches are imported by concurrent worker threads.
+
+    Concurrency is opt-in with -w/--workers and only used in JSONline mode
+    with the simple schema: the lookups of shared objects in the default
+    schema would race between transactions and create duplicates, and
+    SQLite only supports a single writer at a time.
+
+    Args:
+        args (argparse.Namespace): Parsed arguments.
+        importer (SQLThemAll): Importer to use.
+
+    Returns:
+        bool: True if the import should use worker threads.
+    """
+    if args.workers is None or not args.line or args.sequential:
+        return False
+    if not importer.simple or importer.engine.name == "sqlite":
+        logger.warning(
+            "Ignoring -w/--workers, concurrent imports need the simple "
+            "schema (-s) and a database other than SQLite"
+        )
+        return False
+    return True
 
 
 def main() -> None:
@@ -240,10 +699,18 @@ def main() -> None:
     args = parse_args(sys.argv[1:])
 
     importer: SQLThemAll = gen_importer(args=args)
-
-    for j in read_from_source(args=args):
-        if j is not None:
-            importer.import_multi_json(j)
+    batches = read_from_source(args=args)
+    if args.line and args.commit_batch > 1:
+        batches = coalesce(batches, args.commit_batch)
+    with contextlib.closing(prefetch(batches)) as batches:
+        if use_concurrent_import(args, importer):
+            import_concurrently(importer, batches, workers=args.workers)
+            return
+
+        import_multi_json = importer.import_multi_json
+        for j in batches:
+            if j is not None:
+                import_multi_json(j)
 
 
 if __name__ == "__main__":
@@ -6,18 +6,22 @@ from sqlthemall.main import parse_args
 
 default_args = {
     "autocommit": False,
-    "batch_size": [100],
-    "dburl": ["sqlite://"],
+    "batch_size": 100,
+    "bulk_load": False,
+    "dburl": "sqlite://",
     "echo": False,
     "file": None,
     "line": False,
-    "loglevel": ["INFO"],
+    "loglevel": "INFO",
     "no_progress": False,
     "noimport": False,
-    "root_table": ["main"],
+    "root_table": "main",
     "sequential": False,
     "simple": False,
-    "url": None
+    "url": None,
+    "workers": None,
+    "stable_schema_after": 0,
+    "commit_batch": 1
 }
 
 @pytest.mark.parametrize("arg", default_args.keys())
@@ -1,16 +1,39 @@
 #!/usr/bin/env python3
 
+import bz2
+import gzip
+import lzma
+import threading
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+
 import pytest
-from sqlalchemy import Connection, MetaData, create_engine
+from sqlalchemy import Connection, create_engine
+from sqlalchemy.orm import Session
 
 from sqlthemall.json_importer import SQLThemAll
-from sqlthemall.main import gen_importer, parse_args, read_from_source
+from sqlthemall.main import (
+    gen_importer,
+    coalesce,
+    import_concurrently,
+    iter_byte_lines,
+    main,
+    parse_args,
+    prefetch,
+    read_from_source,
+    read_json,
+    read_mapped,
+    use_concurrent_import,
+)
 
 
 DEFAULT_ROOT_TABLE = "main"
 
 required_args = ["-d", "sqlite://"]
 
+# Shared by the tests which only inspect an importer with default options
+default_importer = SQLThemAll()
+
 
 @pytest.mark.parametrize("dburl", [None, "sqlite://", "sqlite:///test.sqlite"])
 def test_importer_engine(dburl):
@@ -21,7 +44,7 @@ def test_importer_engine(dburl):
         dburl (str): Database URL.
     """
     if dburl is None:
-        importer = SQLThemAll()
+        importer = default_importer
         dburl = "sqlite://"
     else:
         args = parse_args(["-d", dburl])
@@ -99,6 +122,25 @@ def test_importer_simple(simple):
     assert importer.simple is simple
 
 
+@pytest.mark.parametrize("bulk_load", [True, False])
+def test_importer_bulk_load(bulk_load, tmp_path):
+    """
+    Tests various values of the bulk load option.
+
+    Attributes:
+        bulk_load (bool): Value of the bulk_load option.
+    """
+    dburl = "sqlite:///" + (tmp_path / "test.sqlite").as_posix()
+    if bulk_load is False:
+        args = parse_args(["-d", dburl])
+    else:
+        args = parse_args(["-d", dburl, "--bulk-load"])
+    importer = gen_importer(args)
+    assert importer.bulk_load is bulk_load
+    synchronous = importer.connection.exec_driver_sql("PRAGMA synchronous")
+    assert (synchronous.scalar() == 0) is bulk_load
+
+
 @pytest.mark.parametrize("url", ["https://restcountries.com/v2/all"])
 def test_url_argument(url):
     """
@@ -125,6 +167,18 @@ def test_file_argument(file):
         assert isinstance(obj, (dict, list))
 
 
+@pytest.mark.parametrize("files", [["data/example.json", "data/example.json"]])
+def test_multiple_file_arguments(files):
+    """
+    Tests "--file" argument with several files to read JSON from.
+
+    Attributes:
+        files (list): File paths to load JSON from.
+    """
+    args = parse_args(required_args + ["--file"] + files)
+    assert len(list(read_from_source(args))) == len(files)
+
+
 @pytest.mark.parametrize("file", ["data/json_lines.json"])
 def test_line_argument(file):
     """
@@ -138,17 +192,251 @@ def test_line_argument(file):
         assert isinstance(obj, (dict, list))
 
 
+@pytest.mark.parametrize("file", ["data/example.json"])
+def test_read_mapped(tmp_path, file):
+    """
+    Tests parsing whole JSON files through a memory map.
+
+    Attributes:
+        file (str): File path to load JSON from.
+    """
+    with open(file, "rb") as f:
+        assert read_mapped(file) == next(read_json(f))
+    invalid = tmp_path / "invalid.json"
+    invalid.write_bytes(b'{"a": ')
+    assert read_mapped(str(invalid)) is None
+
+
+@pytest.mark.parametrize(
+    "suffix,compress",
+    [(".gz", gzip.compress), (".bz2", bz2.compress), (".xz", lzma.compress)],
+)
+def test_compressed_file_argument(tmp_path, suffix, compress):
+    """
+    Tests "--file" argument with compressed JSON lines.
+
+    Attributes:
+        suffix (str): Suffix of the compressed file.
+        compress (function): Function to compress the file content with.
+    """
+    with open("data/json_lines.json", "rb") as f:
+        content = f.read()
+    path = tmp_path / ("json_lines.json" + suffix)
+    path.write_bytes(compress(content))
+    args = parse_args(required_args + ["--line", "--file", str(path)])
+    plain = parse_args(
+        required_args + ["--line", "--file", "data/json_lines.json"]
+    )
+    assert list(read_from_source(args)) == list(read_from_source(plain))
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 10])
+def test_coalesce(n):
+    """
+    Tests joining consecutive batches.
+
+    Attributes:
+        n (int): Number of batches to join.
+    """
+    batches = [[1, 2], None, [3], [4, 5], [], [6]]
+    joined = list(coalesce(batches, n))
+    assert all(joined)
+    assert [i for batch in joined for i in batch] == [1, 2, 3, 4, 5, 6]
+    assert len(joined) == -(-4 // n)
+    assert list(coalesce([{"a": 1}, [2]], 2)) == [[{"a": 1}, 2]]
+
+
+@pytest.mark.parametrize("depth", [1, 2, 8])
+def test_prefetch(depth):
+    """
+    Tests that prefetched items keep their order and errors are raised.
+
+    Attributes:
+        depth (int): Maximum number of items read ahead.
+    """
+    assert list(prefetch(range(20), depth=depth)) == list(range(20))
+
+    def failing():
+        yield 1
+        raise ValueError("broken source")
+
+    items = prefetch(failing(), depth=depth)
+    assert next(items) == 1
+    with pytest.raises(ValueError):
+        next(items)
+
+
+def test_prefetch_closes_source():
+    """Tests that the source is closed when the consumer stops early."""
+    closed = threading.Event()
+
+    def source():
+        try:
+            yield from range(1000)
+        finally:
+            closed.set()
+
+    items = prefetch(source(), depth=1)
+    assert next(items) == 0
+    items.close()
+    assert closed.wait(timeout=5)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1024])
+def test_iter_byte_lines(chunk_size):
+    """
+    Tests splitting byte chunks into lines.
+
+    Attributes:
+        chunk_size (int): Size of the chunks to split the data into.
+    """
+    data = b'{"a": 1}\n\n{"b": [1, 2]}\n{"c": "d"}'
+    stream = BytesIO(data)
+    chunks = iter(lambda: stream.read(chunk_size), b"")
+    assert list(iter_byte_lines(chunks)) == data.split(b"\n")
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 3, 100])
+@pytest.mark.parametrize("stream", [StringIO, BytesIO])
+def test_read_json_batches(batch_size, stream):
+    """
+    Tests the batching of JSON lines skipping blank and invalid lines.
+
+    Attributes:
+        batch_size (int): Number of objects per batch.
+        stream (type): Text or binary stream to read from.
+    """
+    text = '{"a": 1}\n \r\n{"a": 2}\r\n{"a": \n[3]\n'
+    source = stream(text.encode() if stream is BytesIO else text)
+    batches = list(read_json(source, lines=True, batch_size=batch_size))
+    assert all(0 < len(batch) <= batch_size for batch in batches)
+    assert [obj for batch in batches for obj in batch] == [
+        {"a": 1},
+        {"a": 2},
+        [3],
+    ]
+
+
 def test_importer_initial_connection():
     """Tests the initial status of the connetion attribute."""
-    importer = SQLThemAll()
+    importer = default_importer
     assert importer.connection is not None
     assert isinstance(importer.connection, Connection)
 
 
 def test_importer_metadata():
     """Tests the correctnes of the importer.metadata."""
-    importer = SQLThemAll()
-    engine = importer.engine
-    metadata = MetaData()
-    metadata.reflect(bind=engine)
-    assert importer.metadata.sorted_tables == metadata.sorted_tables
+    importer = default_importer
+    # A new in-memory database has no tables to reflect
+    assert importer.metadata.sorted_tables == []
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_import_concurrently(workers, tmp_path):
+    """
+    Tests the import of JSON batches by concurrent worker threads.
+
+    Attributes:
+        workers (int): Number of worker threads.
+    """
+    dburl = "sqlite:///" + (tmp_path / "test.sqlite").as_posix()
+    importer = SQLThemAll(dburl=dburl, progress=False)
+    batches = [[{"n": i, "s": str(i)}, {"n": -i}] for i in range(1, 11)]
+    import_concurrently(importer, batches, workers=workers)
+    with Session(importer.engine) as session:
+        assert session.query(importer.classes["main"]).count() == 20
+
+
+@pytest.mark.parametrize(
+    "extra_args,simple,engine_name,expected",
+    [
+        (["-l"], True, "postgresql", False),
+        (["-l", "-w", "4"], True, "postgresql", True),
+        (["-l", "-w", "4", "-S"], True, "postgresql", False),
+        (["-w", "4"], True, "postgresql", False),
+        (["-l", "-w", "4"], False, "postgresql", False),
+        (["-l", "-w", "4"], True, "sqlite", False),
+    ],
+)
+def test_use_concurrent_import(extra_args, simple, engine_name, expected):
+    """
+    Tests when batches are imported by concurrent worker threads.
+
+    Attributes:
+        extra_args (list): Arguments besides the database url.
+        simple (bool): Value of the simple option of the importer.
+        engine_name (str): Name of the database dialect.
+        expected (bool): Whether worker threads should be used.
+    """
+    args = parse_args(required_args + extra_args)
+    importer = SimpleNamespace(
+        simple=simple, engine=SimpleNamespace(name=engine_name)
+    )
+    assert use_concurrent_import(args, importer) is expected
+
+
+@pytest.mark.parametrize(
+    "extra_args",
+    [
+        ["-w", "0"],
+        ["-w", "-2"],
+        ["-w", "x"],
+        ["-F", "-1"],
+        ["-C", "0"],
+        ["-N", "0"],
+        ["-N", "-5"],
+    ],
+)
+def test_invalid_numeric_arguments(extra_args):
+    """
+    Tests that numeric options reject values out of their range.
+
+    Attributes:
+        extra_args (list): Arguments besides the database url.
+    """
+    with pytest.raises(SystemExit):
+        parse_args(required_args + extra_args)
+
+
+def test_main_concurrent_import(tmp_path, monkeypatch):
+    """Tests that main imports batches in worker threads if requested."""
+    path = tmp_path / "lines.json"
+    path.write_text("".join(f'{{"n": {i}}}\n' for i in range(10)))
+    imported = []
+
+    def import_multi_json(batch):
+        imported.append((threading.current_thread(), batch))
+
+    importer = SimpleNamespace(
+        simple=True,
+        engine=SimpleNamespace(name="postgresql"),
+        import_multi_json=import_multi_json,
+    )
+    monkeypatch.setattr("sqlthemall.main.gen_importer", lambda args: importer)
+    monkeypatch.setattr(
+        "sys.argv",
+        ["sqlthemall", "-d", "postgresql://", "-l", "-N", "3", "-w", "2"]
+        + ["-f", str(path)],
+    )
+    main()
+    assert sorted(obj["n"] for _, batch in imported for obj in batch) == list(
+        range(10)
+    )
+    assert threading.main_thread() not in {t for t, _ in imported}
+
+
+def test_main_single_object_file(tmp_path, monkeypatch):
+    """Tests importing a file holding a single JSON object via the CLI."""
+    path = tmp_path / "single.json"
+    path.write_text('{"name": "x", "n": 3, "sub": {"a": 1}}')
+    dburl = "sqlite:///" + (tmp_path / "test.sqlite").as_posix()
+    monkeypatch.setattr(
+        "sys.argv", ["sqlthemall", "-d", dburl, "-p", "-f", str(path)]
+    )
+    main()
+    engine = create_engine(dburl)
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql("SELECT name, n FROM main")
+        assert rows.fetchall() == [("x", 3)]
+        sub = connection.exec_driver_sql("SELECT a FROM sub")
+        assert sub.fetchall() == [(1,)]
@@ -1,15 +1,21 @@
 #!/usr/bin/env python3
 
+import logging
 from pathlib import Path
 
 import pytest
 
 try:
-    import ujson as json
+    import orjson as json
 except ImportError:
-    import json  # type: ignore
+    try:
+        import ujson as json  # type: ignore
+    except ImportError:
+        import json  # type: ignore
 
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, selectinload
 
 from sqlthemall.json_importer import SQLThemAll
 from tests.utils import compare_obj, dbobj2obj
@@ -20,13 +26,24 @@ def readfile(inputfile):
     Reads the content of the provided filename.
 
     Attributes:
-        inputfile (str): Name or path of the file to read.
+        inputfile (str|Path): Name or path of the file to read.
     """
     with open(inputfile) as f:
         return f.read().strip()
 
 
-paths = [p.as_posix()[14:-5] for p in Path("data/testdata/").glob("*.json")]
+testdata_dir = Path("data/testdata")
+testvalidate_dir = Path("data/testvalidate")
+paths = [p.stem for p in testdata_dir.glob("*.json")]
+# Parsed once per module, mapping path -> (jsonobj, schema, simple_schema)
+fixtures = {
+    p: (
+        json.loads((testdata_dir / f"{p}.json").read_bytes()),
+        readfile(testvalidate_dir / f"{p}.schema"),
+        readfile(testvalidate_dir / f"{p}.simple_schema"),
+    )
+    for p in paths
+}
 
 
 @pytest.mark.parametrize("path", paths)
@@ -37,8 +54,7 @@ def test_schema_generation(path):
     Attributes:
         path (str): Path of a JSON file to create the schema from.
     """
-    jsonobj = json.loads(readfile("data/testdata/" + path + ".json"))
-    schema = readfile("data/testvalidate/" + path + ".schema")
+    jsonobj, schema, _ = fixtures[path]
     importer = SQLThemAll()
     importer.create_schema(jsonobj)
     assert str(importer.metadata.sorted_tables) == schema
@@ -52,26 +68,48 @@ def test_schema_generation_simple(path):
     Attributes:
         path (str): Path of a JSON file to create the schema from.
     """
-    jsonobj = json.loads(readfile("data/testdata/" + path + ".json"))
-    schema = readfile("data/testvalidate/" + path + ".simple_schema")
+    jsonobj, _, schema = fixtures[path]
     importer = SQLThemAll(simple=True)
     importer.create_schema(jsonobj)
     assert str(importer.metadata.sorted_tables) == schema
 
 
-objects = [
-    json.loads(readfile("data/testdata/" + p + ".json"))
-    for p in paths
-    if p.startswith("object")
-]
-arrays = [
-    json.loads(readfile("data/testdata/" + p + ".json"))
-    for p in paths
-    if p.startswith("array")
-]
+objects = [fixtures[p][0] for p in paths if p.startswith("object")]
+arrays = [fixtures[p][0] for p in paths if p.startswith("array")]
 root_tables = ["main", "name", "test1", 1, True, False, None]
 
 
+relationships: dict = {}
+
+
+def collection_attrs(cls):
+    """
+    Returns the names of the collection relationships of an orm class.
+
+    Attributes:
+        cls: Sqlalchemy orm class.
+    """
+    if cls not in relationships:
+        relationships[cls] = tuple(
+            k
+            for k in inspect(cls).relationships.keys()
+            if k.endswith("_collection")
+        )
+    return relationships[cls]
+
+
+def query_with_collections(session, cls):
+    """
+    Queries all objects of an orm class eager loading their collections.
+
+    Attributes:
+        session (Session): Session to query with.
+        cls: Sqlalchemy orm class.
+    """
+    options = [selectinload(getattr(cls, a)) for a in collection_attrs(cls)]
+    return session.query(cls).options(*options).all()
+
+
 def tablename(c):
     """
     Returns table name of the provided orm object class.
@@ -100,11 +138,9 @@ def test_import_json(obj, simple, root_table):
         c for c in importer.classes if tablename(c) == importer.root_table
     ][0]
     with Session(importer.engine) as session:
-        if session.query(root_class).all():
-            dbobj = session.query(root_class).all()[0]
-            for a in [i for i in dir(dbobj) if i.endswith("_collection")]:
-                getattr(dbobj, a)
-            assert compare_obj(dbobj2obj(dbobj), obj)
+        dbobjs = query_with_collections(session, root_class)
+        if dbobjs:
+            assert compare_obj(dbobj2obj(dbobjs[0]), obj)
 
 
 @pytest.mark.parametrize("array", arrays)
@@ -125,8 +161,146 @@ def test_import_multi_json(array, simple, root_table):
         c for c in importer.classes if tablename(c) == importer.root_table
     ][0]
     with Session(importer.engine) as session:
-        dbobjs = session.query(root_class).all()
+        dbobjs = query_with_collections(session, root_class)
         for dbobj, obj in zip(dbobjs, array):
-            for a in [i for i in dir(dbobj) if i.endswith("_collection")]:
-                getattr(dbobj, a)
             assert compare_obj(dbobj2obj(dbobj), obj)
+
+
+def test_schema_extended_by_known_objects():
+    """Tests that structurally known objects still extend the schema."""
+    importer = SQLThemAll(progress=False)
+    importer.import_multi_json([{"a": 1, "b": {"c": "x"}}])
+    importer.import_multi_json([{"a": 2, "b": {"c": "y"}}])
+    assert set(importer.metadata.tables) == {"main", "b"}
+    importer.import_multi_json([{"a": 3, "b": {"c": "z", "d": 1.5}}])
+    assert "d" in importer.metadata.tables["b"].columns
+    importer.import_multi_json([{"a": 0, "e": []}])
+    importer.import_multi_json([{"a": 0, "e": ["f"]}])
+    assert "e" in importer.metadata.tables
+
+
+def test_stable_schema_after():
+    """Tests that the schema is frozen once it stopped changing."""
+    importer = SQLThemAll(progress=False, stable_schema_after=2)
+    importer.import_multi_json([{"a": 1, "b": {"c": "x"}}])
+    importer.import_multi_json([{"a": 1, "b": {"c": "x"}}, {"a": 2}])
+    assert not importer.schema_frozen
+    importer.import_multi_json([{"a": 3, "e": 1}])
+    assert not importer.schema_frozen
+    importer.import_multi_json([{"a": 4}])
+    importer.import_multi_json([{"a": 5}])
+    assert importer.schema_frozen
+    importer.import_multi_json([{"a": 6, "d": 5}])
+    assert "d" not in importer.metadata.tables["main"].columns
+    with Session(importer.engine) as session:
+        assert session.query(importer.classes["main"]).count() == 6
+
+
+@pytest.mark.parametrize("simple", [False, True])
+def test_frozen_schema_drops_unknown_keys(simple, caplog):
+    """
+    Tests that a frozen schema keeps the objects without their unknown keys.
+
+    Attributes:
+        simple (bool): Value of the simple db scheme option.
+    """
+    importer = SQLThemAll(simple=simple, progress=False, stable_schema_after=1)
+    importer.import_multi_json([{"a": 1, "b": {"c": "x"}}])
+    importer.import_multi_json([{"a": 2, "b": {"c": "y"}}])
+    assert importer.schema_frozen
+    caplog.set_level(logging.WARNING, logger="sqlthemall")
+    importer.import_multi_json(
+        [{"a": 3, "d": 5, "b": {"c": "z", "e": 1}, "f": {"g": 1}}]
+    )
+    assert "d" not in importer.metadata.tables["main"].columns
+    assert "f" not in importer.metadata.tables
+    with Session(importer.engine) as session:
+        rows = session.query(importer.classes["main"]).all()
+        assert [r.a for r in rows] == [1, 2, 3]
+        assert rows[2].b_collection[0].c == "z"
+    warnings = [r.getMessage() for r in caplog.records]
+    assert any("key d of main" in m for m in warnings)
+    assert any("key e of b" in m for m in warnings)
+    assert any("objects of f" in m for m in warnings)
+
+
+def test_import_leaf_rows_simple():
+    """Tests that bulk inserted leaf rows are linked to their parents."""
+    importer = SQLThemAll(simple=True, progress=False)
+    array = [
+        {"n": 1, "tags": ["a", "b"], "o": {"x": 1}},
+        {"n": 2, "tags": ["c"], "o": {"x": 2}},
+    ]
+    importer.import_multi_json(array)
+    with Session(importer.engine) as session:
+        dbobjs = session.query(importer.classes["main"]).all()
+        assert len(dbobjs) == 2
+        for dbobj, obj in zip(dbobjs, array):
+            assert [t.value for t in dbobj.tags_collection] == obj["tags"]
+            assert dbobj.o_collection[0].x == obj["o"]["x"]
+
+
+@pytest.mark.parametrize("size", [100, 10_000])
+def test_import_multi_json_bulk_rows(size):
+    """
+    Tests importing large arrays of leaf objects through the bulk insert.
+
+    Attributes:
+        size (int): Number of objects to import.
+    """
+    importer = SQLThemAll(simple=True, progress=False)
+    array = [{"n": i, "s": str(i)} for i in range(size)]
+    importer.import_multi_json(array)
+    with Session(importer.engine) as session:
+        root_class = importer.classes["main"]
+        assert session.query(root_class).count() == size
+        last = session.query(root_class).filter_by(n=size - 1).one()
+        assert last.s == str(size - 1)
+
+
+@pytest.mark.parametrize("simple", [True, False])
+def test_import_multi_json_skips_failing_objects(simple):
+    """
+    Tests that objects which can not be inserted only drop themselves.
+
+    Attributes:
+        simple (bool): Value of the simple db scheme option.
+    """
+    importer = SQLThemAll(simple=simple, progress=False)
+    array = [{"n": i} for i in range(7)]
+    array[4] = {"n": 2**70}
+    importer.import_multi_json(array)
+    with Session(importer.engine) as session:
+        dbobjs = session.query(importer.classes["main"]).all()
+        assert [dbobj.n for dbobj in dbobjs] == [0, 1, 2, 3, 5, 6]
+
+
+def test_insert_batch_logs_skipped_object(caplog):
+    """Tests that only the skipped object is logged with its traceback."""
+    importer = SQLThemAll(progress=False)
+    array = [{"n": i} for i in range(7)]
+    array[4] = {"n": 2**70}
+    caplog.set_level(logging.DEBUG, logger="sqlthemall")
+    importer.import_multi_json(array)
+    errors = [r for r in caplog.records if r.levelno == logging.ERROR]
+    assert len(errors) == 1
+    assert errors[0].exc_info is not None
+    splits = [r for r in caplog.records if "splitting" in r.getMessage()]
+    assert splits
+    assert all(r.levelno == logging.DEBUG for r in splits)
+    assert all(r.exc_info is None for r in splits)
+
+
+def test_insert_batch_stops_on_connection_errors(monkeypatch):
+    """Tests that connection level errors are not bisected."""
+    importer = SQLThemAll(progress=False)
+    calls = []
+
+    def insert(jsonobjs, raise_errors=False):
+        calls.append(jsonobjs)
+        raise OperationalError("INSERT", {}, Exception("connection lost"))
+
+    monkeypatch.setattr(importer, "insert_data_to_schema", insert)
+    with pytest.raises(OperationalError):
+        importer.insert_batch([{"n": i} for i in range(8)])
+    assert len(calls) == 1
@@ -1,7 +1,40 @@
 #!/usr/bin/env python3
 
+import functools
+from typing import Callable, Union
+
+from sqlalchemy import inspect
 from sqlalchemy.orm.collections import InstrumentedList
 
+dumps: Callable[..., Union[bytes, str]]
+try:
+    import orjson
+
+    dumps = functools.partial(orjson.dumps, option=orjson.OPT_SORT_KEYS)
+except ImportError:
+    import json
+
+    dumps = functools.partial(json.dumps, sort_keys=True)
+
+
+attributes: dict = {}
+
+
+def mapped_attrs(cls):
+    """
+    Returns the value column and relationship names of an orm class.
+
+    Attributes:
+        cls: Sqlalchemy orm class.
+    """
+    if cls not in attributes:
+        mapper = inspect(cls)
+        attributes[cls] = (
+            tuple(k for k in mapper.columns.keys() if not k.endswith("_id")),
+            tuple(mapper.relationships.keys()),
+        )
+    return attributes[cls]
+
 
 def dbobj2obj(dbobj, parent_class=None):
     """
@@ -14,24 +47,59 @@ def dbobj2obj(dbobj, parent_class=None):
         parent_class (type): Type of the parent_class of the object.
     """
     obj2 = {}
-    for k, v in dbobj.__dict__.items():
-        if k not in {"_sa_instance_state", "_id"} and not k.endswith("_id"):
-            if v.__class__ in {str, int, float, bool}:
-                obj2[k.lower()] = v
-            elif v.__class__ == InstrumentedList:
-                if v:
-                    if v[0].__class__ != parent_class:
-                        obj2[k.lower().replace("_collection", "")] = [
-                            dbobj2obj(i, parent_class=dbobj.__class__)
-                            for i in v
-                        ]
-    obj3 = {k: obj2[k] for k in sorted(obj2.keys())}
-    if "value" in obj3.keys():
+    # Only loaded attributes are in __dict__, reading them never emits SQL
+    loaded = dbobj.__dict__
+    columns, relationships = mapped_attrs(dbobj.__class__)
+    for k in columns:
+        v = loaded.get(k)
+        if isinstance(v, (str, int, float, bool)):
+            obj2[k.lower()] = v
+    for k in relationships:
+        v = loaded.get(k)
+        if isinstance(v, InstrumentedList) and v:
+            if v[0].__class__ is not parent_class:
+                obj2[k.lower().replace("_collection", "")] = [
+                    dbobj2obj(i, parent_class=dbobj.__class__) for i in v
+                ]
+    obj3 = dict(sorted(obj2.items()))
+    if "value" in obj3:
         return obj3["value"]
     return obj3
 
 
+def canonicalize(o):
+    """
+    Lowercases all keys of the provided object recursively.
+
+    Attributes:
+        o: A python object.
+    """
+    if isinstance(o, dict):
+        return {k.lower(): canonicalize(v) for k, v in o.items()}
+    if isinstance(o, list):
+        return [canonicalize(v) for v in o]
+    return o
+
+
 def compare_obj(obj1, obj2):
+    """
+    Compares two objects.
+
+    Objects with equal canonical JSON serializations are equal right away,
+    all others are compared field by field with compare_fields.
+
+    Attributes:
+        obj1 (dict): A python object.
+        obj2 (dict): A python object to be compared with.
+    """
+    if obj1 is obj2:
+        return True
+    if dumps(canonicalize(obj1)) == dumps(canonicalize(obj2)):
+        return True
+    return compare_fields(obj1, obj2)
+
+
+def compare_fields(obj1, obj2):
     """
     Compares two objects recursively.
 
@@ -51,12 +119,16 @@ def compare_obj(obj1, obj2):
         Attributes:
             o (dict): A python object to normalize.
         """
-        obj2, obj3 = {}, {}
-        for k in o.keys():
-            obj2[k.lower()] = o[k]
-        for k in sorted(obj2.keys()):
-            obj3[k] = obj2[k]
-        return obj3
+        return {k.lower(): o[k] for k in sorted(o, key=str.lower)}
+
+    def unwrap(o):
+        """
+        Returns the only item of a list with a single item.
+
+        Attributes:
+            o: A python object.
+        """
+        return o[0] if isinstance(o, list) and len(o) == 1 else o
 
     def compare_val(val1, val2):
         """
@@ -66,35 +138,35 @@ def compare_obj(obj1, obj2):
             val1: A python object.
             val2: A python object to be compared.
         """
+        if val1 is val2:
+            return True
         if isinstance(val1, (str, int, float)):
             return val1 == val2
         if isinstance(val1, bool):
             return val1 is val2
         if isinstance(val1, dict) and isinstance(val2, dict):
             val1, val2 = normalize(val1), normalize(val2)
-            return compare_obj(val1, val2)
+            return compare_fields(val1, val2)
         if isinstance(val1, list) and isinstance(val2, list):
             for sval1, sval2 in zip(val1, val2):
                 if not compare_val(sval1, sval2):
                     return False
         elif isinstance(val1, (list, dict)) and isinstance(val2, (list, dict)):
-            if isinstance(val1, list) and len(val1) == 1:
-                val1 = val1[0]
-            elif isinstance(val2, list) and len(val2) == 1:
-                val2 = val2[0]
-            val1, val2 = normalize(val1), normalize(val2)
-            return compare_obj(val1, val2)
+            # One side is a list, only that one can be unwrapped
+            val1, val2 = normalize(unwrap(val1)), normalize(unwrap(val2))
+            return compare_fields(val1, val2)
         return True
 
     if isinstance(obj1, dict) and isinstance(obj2, dict):
         obj1, obj2 = normalize(obj1), normalize(obj2)
 
-        for k in obj1:
-            if isinstance(obj1[k], list) and isinstance(obj2[k], list):
-                for i in range(len(obj1[k])):
-                    if not compare_val(obj1[k][i], obj2[k][i]):
+        for k, v1 in obj1.items():
+            v2 = obj2[k]
+            if isinstance(v1, list) and isinstance(v2, list):
+                for i, sval1 in enumerate(v1):
+                    if not compare_val(sval1, v2[i]):
                         return False
-            if not compare_val(obj1[k], obj2[k]):
+            if not compare_val(v1, v2):
                 return False
         return True
 